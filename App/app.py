@@ -1,12 +1,19 @@
 # app.py
 import asyncio
 import json
+import os
+import struct
+import sys
+import threading
 import uuid
-from collections import deque
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 import mediapipe as mp
+import onnxruntime as ort
+import tensorflow as tf
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -14,12 +21,42 @@ from fastapi.responses import FileResponse
 from tensorflow.keras.models import load_model
 import uvicorn
 
+# keypoints.py lives in the repo root and is shared with the capture/live scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keypoints import KEYPOINT_LENGTH, extract_keypoints, new_keypoint_buffer
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _TJ = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # package or libturbojpeg missing
+    _TJ = None
+
 # ---------- Config ----------
 MODEL_PATH = "best_model.h5"
+TFLITE_PATH = "best_model.fp16.tflite"   # built from MODEL_PATH on first start
+TFLITE_BATCH_PATH = "best_model.fp16.b16.tflite"   # same, traced at a batch of MAX_BATCH
+ONNX_PATH = "best_model.onnx"            # preferred when present (python convert_model.py --onnx)
 ACTIONS_PATH = "actions.npy"
 SEQUENCE_LENGTH = 40       # MUST match your training SEQUENCE_LENGTH
 THRESHOLD = 0.6
 SMOOTHING_WINDOW = 12
+HOLISTIC_WORKERS = 4       # Holistic instances shared by all clients
+MAX_BATCH = 16             # max client sequences per model call (MUST match BATCH_SIZE in convert_model.py)
+MOTION_EPS = 0.01          # keypoint L2 change below which a frame counts as "still"
+MAX_SKIPPED = 5            # max consecutive still frames that reuse the last prediction
+FRAME_SIZE = (320, 240)    # (width, height) fed to Mediapipe
+HOLISTIC_EVERY = 2         # run Holistic on every Nth JPEG frame, extrapolate the rest
+KEYPOINTS_MSG = 0x01       # version byte of client-side keypoint messages (JPEGs start with 0xFF)
+KEYPOINTS_HEADER = 4       # version byte + padding so the float32 payload stays aligned
+PROBS_EVERY = 10           # resend the full probabilities at least every N frames
+KP_SCALE = 8192.0          # keypoints are stored as int16 * 1/KP_SCALE (covers -4..4)
+
+# Binary response: flags, top-1 index, 2 pad bytes, confidence, frame count,
+# optionally followed by len(actions) float32 probabilities (little-endian)
+RESPONSE_HDR = struct.Struct('<BBxxfI')
+FLAG_READY = 0x01          # a full window has been classified
+FLAG_CONFIDENT = 0x02      # top-1 passed THRESHOLD and the smoothing vote
+FLAG_PROBS = 0x04          # probabilities appended after the header
 
 # ---------- FastAPI setup ----------
 app = FastAPI()
@@ -36,9 +73,37 @@ app.add_middleware(
 # ---------- Load model + actions ----------
 print("Loading model and actions...")
 try:
-    model = load_model(MODEL_PATH)
+    session = interpreter = batch_interpreter = None
+    if os.path.exists(ONNX_PATH):
+        # ONNX Runtime: fused RNN/GEMM kernels and a dynamic batch dimension
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = os.cpu_count()
+        session = ort.InferenceSession(ONNX_PATH, sess_options=so, providers=["CPUExecutionProvider"])
+        input_name = session.get_inputs()[0].name
+        model_file = ONNX_PATH
+    else:
+        # TFLite's fused RNN state has a static batch, so there is one model traced at a batch
+        # of 1 (lone windows) and one at MAX_BATCH (coalesced windows, zero-padded)
+        keras_model = None
+        for path, batch in ((TFLITE_PATH, 1), (TFLITE_BATCH_PATH, MAX_BATCH)):
+            if not os.path.exists(path):
+                from convert_model import convert_fp16
+                print(f"⚠ {path} not found, converting {MODEL_PATH}...")
+                keras_model = keras_model or load_model(MODEL_PATH)
+                with open(path, "wb") as f:
+                    f.write(convert_fp16(keras_model, batch=batch))
+        interpreter = tf.lite.Interpreter(model_path=TFLITE_PATH, num_threads=os.cpu_count())
+        batch_interpreter = tf.lite.Interpreter(model_path=TFLITE_BATCH_PATH, num_threads=os.cpu_count())
+        for interp in (interpreter, batch_interpreter):
+            interp.allocate_tensors()
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        batch_input_index = batch_interpreter.get_input_details()[0]['index']
+        batch_output_index = batch_interpreter.get_output_details()[0]['index']
+        model_file = f"{TFLITE_PATH} + {TFLITE_BATCH_PATH}"
     actions = np.load(ACTIONS_PATH).tolist()
-    print(f"✓ Model loaded successfully")
+    print(f"✓ Model loaded successfully ({model_file})")
     print(f"✓ Actions loaded: {actions}")
 except Exception as e:
     print(f"✗ Error loading model/actions: {e}")
@@ -48,41 +113,177 @@ except Exception as e:
 mp_holistic = mp.solutions.holistic
 mp_drawing = mp.solutions.drawing_utils
 
-FACE_IDX = [0, 13, 14, 17, 61, 291]
+# Holistic is CPU-bound C++ and tracks landmarks from one frame to the next, so it runs on
+# HOLISTIC_WORKERS single-thread executors with one instance each. A connection is pinned to
+# the least busy worker on its first JPEG frame and keeps it for its whole lifetime, so its
+# frames always reach the same instance in order and, up to HOLISTIC_WORKERS JPEG clients,
+# no other client's frames do. Clients sending browser-side keypoints never take a worker.
+# Memory stays at HOLISTIC_WORKERS models regardless of how many clients are connected.
+WORKERS = [ThreadPoolExecutor(max_workers=1) for _ in range(HOLISTIC_WORKERS)]
+worker_clients = [0] * HOLISTIC_WORKERS     # JPEG connections currently pinned to each worker
+_tls = threading.local()
 
 
-def mediapipe_process_frame(cv_image, holistic):
-    """Process frame with Mediapipe"""
-    image_rgb = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
+def _get_worker():
+    """Return this worker thread's Holistic instance and scratch buffers, creating them on first use"""
+    if not hasattr(_tls, "holistic"):
+        # Lightest backbones: frames are only 320x240 and we keep just 6 face points
+        _tls.holistic = mp_holistic.Holistic(
+            model_complexity=0,
+            refine_face_landmarks=False,
+            enable_segmentation=False,
+            smooth_landmarks=False,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        _tls.keypoints, _tls.filled = new_keypoint_buffer()
+        _tls.rgb = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    return _tls
+
+
+def mediapipe_process_frame(image_rgb, holistic):
+    """Process an RGB frame with Mediapipe"""
     image_rgb.flags.writeable = False
     results = holistic.process(image_rgb)
     image_rgb.flags.writeable = True
     return results
 
 
-def extract_keypoints(results):
-    """Extract keypoints from Mediapipe results"""
-    pose = np.array([[res.x, res.y, res.z, res.visibility]
-                     for res in results.pose_landmarks.landmark]).flatten() if results.pose_landmarks else np.zeros(33*4)
+def parse_keypoints(message):
+    """Return the float32 keypoints of a client-side keypoint message, or None for a JPEG frame"""
+    if (len(message) == KEYPOINTS_HEADER + KEYPOINT_LENGTH * 4
+            and message[0] == KEYPOINTS_MSG):
+        return np.frombuffer(message, dtype='<f4', offset=KEYPOINTS_HEADER)
+    return None
 
-    if results.face_landmarks:
-        face = np.array([[results.face_landmarks.landmark[i].x,
-                          results.face_landmarks.landmark[i].y,
-                          results.face_landmarks.landmark[i].z] for i in FACE_IDX]).flatten()
-    else:
-        face = np.zeros(len(FACE_IDX) * 3)
 
-    lh = np.array([[res.x, res.y, res.z] for res in results.left_hand_landmarks.landmark]).flatten(
-    ) if results.left_hand_landmarks else np.zeros(21*3)
-    rh = np.array([[res.x, res.y, res.z] for res in results.right_hand_landmarks.landmark]).flatten(
-    ) if results.right_hand_landmarks else np.zeros(21*3)
+def decode_frame(message, rgb_buf):
+    """Decode a JPEG to a FRAME_SIZE RGB image, or None if it is not a valid JPEG"""
+    if _TJ is not None:
+        # libjpeg-turbo decodes straight to half resolution (640x480 -> 320x240) in RGB
+        try:
+            frame = _TJ.decode(message, pixel_format=TJPF_RGB, scaling_factor=(1, 2))
+        except OSError:
+            return None
+        if frame.shape[1::-1] != FRAME_SIZE:
+            frame = cv2.resize(frame, FRAME_SIZE)
+        return frame
+
+    # libjpeg inside OpenCV can also decode at 1/2 scale (skips the full-res IDCT)
+    frame = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_REDUCED_COLOR_2)
+    if frame is None:
+        return None
+
+    # Other source sizes still need an explicit resize
+    if frame.shape[1::-1] != FRAME_SIZE:
+        frame = cv2.resize(frame, FRAME_SIZE)
+    # OpenCV decodes to BGR, convert into the worker's buffer instead of a new array
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+
+
+def _process_frame(message):
+    """Decode a JPEG and return its float32 keypoints, or None if decoding fails (runs on the client's worker)"""
+    worker = _get_worker()
+    frame_rgb = decode_frame(message, worker.rgb)
+    if frame_rgb is None:
+        return None
+
+    results = mediapipe_process_frame(frame_rgb, worker.holistic)
+    return extract_keypoints(results, worker.keypoints, worker.filled)
+
+
+def extrapolate_keypoints(last, before, step):
+    """Estimate keypoints `step` frames after the last Holistic run from the last two runs"""
+    # Only extrapolate coordinates present in both runs; appearing/vanishing groups just repeat
+    both = (last != 0) & (before != 0)
+    velocity = (last - before) * (step / HOLISTIC_EVERY)
+    return np.where(both, last + velocity, last).astype(np.float32)
+
 
-    return np.concatenate([pose, face, lh, rh])
+# ---------- Batched inference ----------
+# The model runs on its own thread so a batch never blocks the event loop. model_input is
+# only touched from that thread.
+MODEL_THREAD = ThreadPoolExecutor(max_workers=1)
+model_input = np.empty((MAX_BATCH, SEQUENCE_LENGTH, KEYPOINT_LENGTH), dtype=np.float32)
+pending = None              # asyncio.Queue of (sequence, future), created on startup
+batcher_task = None
+
+
+def run_model(windows):
+    """Classify up to MAX_BATCH int16 windows in one model call (runs on MODEL_THREAD)"""
+    n = len(windows)
+    # Dequantize the int16 windows straight into the reused float32 input
+    for i, seq in enumerate(windows):
+        np.multiply(seq, 1.0 / KP_SCALE, out=model_input[i])
+
+    if session is not None:
+        return session.run(None, {input_name: model_input[:n]})[0]
+    if n == 1:
+        interpreter.set_tensor(input_index, model_input[:1])
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+    model_input[n:] = 0.0   # pad to the traced MAX_BATCH, padded rows are discarded
+    batch_interpreter.set_tensor(batch_input_index, model_input)
+    batch_interpreter.invoke()
+    return batch_interpreter.get_tensor(batch_output_index)[:n]
+
+
+async def batch_predictions():
+    """Drain queued sequences from all clients and classify them in one model call"""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await pending.get()]
+        while not pending.empty() and len(items) < MAX_BATCH:
+            items.append(pending.get_nowait())
+
+        try:
+            results = await loop.run_in_executor(MODEL_THREAD, run_model, [seq for seq, _ in items])
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        for (_, fut), res in zip(items, results):
+            if not fut.done():  # client may have disconnected meanwhile
+                fut.set_result(res)
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global pending, batcher_task
+    pending = asyncio.Queue()
+    batcher_task = asyncio.create_task(batch_predictions())
 
 
 # ---------- Per-client state ----------
-clients_sequences = {}      # client_id -> deque of keypoints
+clients_sequences = {}      # client_id -> sliding keypoint window (see new_sequence_buffer)
 clients_predictions = {}    # client_id -> deque of last predictions for smoothing
+clients_counters = {}       # client_id -> Counter of the predictions in that deque
+
+
+def new_sequence_buffer():
+    """Ring buffer holding every frame twice, so the window is always one contiguous slice
+
+    Frames are stored as int16 (see KP_SCALE), halving the per-client footprint.
+    """
+    return {
+        "buf": np.zeros((2 * SEQUENCE_LENGTH, KEYPOINT_LENGTH), dtype=np.int16),
+        "head": 0,
+        "count": 0
+    }
+
+
+def push_keypoints(state, keypoints):
+    """Append a frame and return the ordered (SEQUENCE_LENGTH, D) window view, or None until full"""
+    buf, head = state["buf"], state["head"]
+    buf[head] = np.clip(np.rint(keypoints * KP_SCALE), -32768, 32767)
+    buf[head + SEQUENCE_LENGTH] = buf[head]
+    state["head"] = head = (head + 1) % SEQUENCE_LENGTH
+    state["count"] = min(state["count"] + 1, SEQUENCE_LENGTH)
+    if state["count"] < SEQUENCE_LENGTH:
+        return None
+    return buf[head:head + SEQUENCE_LENGTH]
 
 
 # ---------- WebSocket endpoint ----------
@@ -90,102 +291,164 @@ clients_predictions = {}    # client_id -> deque of last predictions for smoothi
 async def websocket_predict(websocket: WebSocket):
     await websocket.accept()
     client_id = str(uuid.uuid4())
-    clients_sequences[client_id] = deque(maxlen=SEQUENCE_LENGTH)
+    clients_sequences[client_id] = new_sequence_buffer()
     clients_predictions[client_id] = deque(maxlen=SMOOTHING_WINDOW)
+    clients_counters[client_id] = Counter()
     
-    print(f"✓ Client connected: {client_id}")
+    worker_idx = None           # Holistic worker, assigned on the first JPEG frame
     
-    try:
-        with mp_holistic.Holistic(
-            min_detection_confidence=0.5, 
-            min_tracking_confidence=0.5
-        ) as holistic:
-            frame_count = 0
-            
+    print(f"✓ Client connected: {client_id}")
+
+    # Latest-wins mailbox: if frames arrive faster than we classify them, only the
+    # newest one is processed, so latency stays at one frame instead of growing.
+    latest = None
+    closed = False
+    arrived = asyncio.Event()
+
+    async def receive_latest():
+        nonlocal latest, closed
+        try:
             while True:
                 try:
-                    # Receive binary frame data
-                    message = await websocket.receive_bytes()
-                    frame_count += 1
-                    
-                    # Decode JPEG to numpy array
-                    nparr = np.frombuffer(message, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    
-                    if frame is None:
-                        print(f"⚠ Frame {frame_count} decode failed")
-                        continue
-                    
-                    # Resize for faster processing
-                    frame_small = cv2.resize(frame, (320, 240))
-                    
-                    # Process with Mediapipe
-                    results = mediapipe_process_frame(frame_small, holistic)
-                    keypoints = extract_keypoints(results).astype(np.float32)
-                    clients_sequences[client_id].append(keypoints)
-                    
-                    response = {"ready": False}
-                    
-                    # Once we have full sequence, make prediction
-                    if len(clients_sequences[client_id]) == SEQUENCE_LENGTH:
-                        seq = np.expand_dims(
-                            np.array(clients_sequences[client_id], dtype=np.float32), 
-                            axis=0
-                        )
-                        
-                        # Predict
-                        res = model.predict(seq, verbose=0)[0]
-                        pred_idx = int(np.argmax(res))
-                        conf = float(res[pred_idx])
-                        
-                        # Apply smoothing
-                        clients_predictions[client_id].append(pred_idx)
-                        
-                        # Most common prediction in smoothing window
-                        if clients_predictions[client_id]:
-                            most_common = max(
-                                set(clients_predictions[client_id]), 
-                                key=clients_predictions[client_id].count
-                            )
-                        else:
-                            most_common = None
-                        
-                        # Only show prediction if confident and consistent
-                        if conf > THRESHOLD and most_common == pred_idx:
-                            predicted_action = actions[pred_idx]
-                        else:
-                            predicted_action = "..."
-                        
-                        # Build probability dict
-                        probs = {actions[i]: float(res[i]) for i in range(len(actions))}
-                        
-                        response = {
-                            "ready": True,
-                            "predicted_action": predicted_action,
-                            "confidence": conf,
-                            "probs": probs,
-                            "frame_count": frame_count
-                        }
-                        
-                        if frame_count % 50 == 0:
-                            print(f"Client {client_id[:8]}: {predicted_action} ({conf:.2f})")
-                    
-                    # Send response
-                    await websocket.send_text(json.dumps(response))
-                    
-                except WebSocketDisconnect:
-                    print(f"✗ Client disconnected: {client_id}")
-                    break
+                    latest = await websocket.receive_bytes()
+                except (WebSocketDisconnect, RuntimeError):
+                    raise   # RuntimeError: socket no longer readable, retrying would spin
                 except Exception as e:
-                    print(f"⚠ Error processing frame: {e}")
+                    # e.g. a text frame (KeyError on "bytes"): skip it, keep the connection
+                    print(f"⚠ Receive error for {client_id}: {e}")
                     continue
+                arrived.set()
+        except WebSocketDisconnect:
+            print(f"✗ Client disconnected: {client_id}")
+        except RuntimeError as e:
+            print(f"⚠ Receive error for {client_id}: {e}")
+        finally:
+            closed = True
+            arrived.set()
+
+    reader = asyncio.create_task(receive_latest())
+    
+    try:
+        # Label order once per connection (text), per-frame responses index into it (binary)
+        await websocket.send_text(json.dumps({"actions": actions}))
+
+        loop = asyncio.get_running_loop()
+        frame_count = 0
+        last_pred_idx = None
+        last_keypoints = None
+        detected = []               # keypoints of the last two Holistic runs (JPEG clients)
+        last_res = None
+        skipped = 0
+
+        while True:
+            # Wait for the newest keypoints (browser-side Holistic) or JPEG frame
+            if latest is None:
+                if closed:
+                    break
+                arrived.clear()
+                await arrived.wait()
+                continue
+            message, latest = latest, None
+
+            try:
+                frame_count += 1
+
+                keypoints = parse_keypoints(message)
+                if keypoints is None:
+                    step = frame_count % HOLISTIC_EVERY
+                    if step and len(detected) == 2:
+                        # Skip Holistic on this frame, the 40-frame window and vote absorb the estimate
+                        keypoints = extrapolate_keypoints(detected[1], detected[0], step)
+                    else:
+                        # Legacy clients send JPEGs: decode + Mediapipe on this client's worker
+                        if worker_idx is None:
+                            worker_idx = min(range(HOLISTIC_WORKERS), key=worker_clients.__getitem__)
+                            worker_clients[worker_idx] += 1
+                        keypoints = await loop.run_in_executor(WORKERS[worker_idx], _process_frame, message)
+                        if keypoints is not None:
+                            detected = [*detected[-1:], keypoints]
+
+                if keypoints is None:
+                    print(f"⚠ Frame {frame_count} decode failed")
+                    continue
+
+                window = push_keypoints(clients_sequences[client_id], keypoints)
+
+                # Squared L2 change vs. the previous frame (no sqrt needed)
+                still = False
+                if last_keypoints is not None:
+                    diff = keypoints - last_keypoints
+                    still = float(np.dot(diff, diff)) < MOTION_EPS ** 2
+                last_keypoints = keypoints
+
+                response = RESPONSE_HDR.pack(0, 0, 0.0, frame_count)
+                
+                # Once we have full sequence, make prediction
+                if window is not None:
+                    if still and last_res is not None and skipped < MAX_SKIPPED:
+                        # Window barely moved, reuse the last prediction
+                        skipped += 1
+                        res = last_res
+                    else:
+                        # Predict (batched with other clients' pending sequences)
+                        fut = loop.create_future()
+                        await pending.put((window, fut))
+                        res = last_res = await fut
+                        skipped = 0
+                    pred_idx = int(np.argmax(res))
+                    conf = float(res[pred_idx])
+                    
+                    # Apply smoothing, keeping the window's counts up to date incrementally
+                    preds = clients_predictions[client_id]
+                    counter = clients_counters[client_id]
+                    if len(preds) == preds.maxlen:
+                        counter[preds[0]] -= 1  # about to be evicted
+                    preds.append(pred_idx)
+                    counter[pred_idx] += 1
+
+                    # Most common prediction in smoothing window
+                    most_common = counter.most_common(1)[0][0]
+                    
+                    # Only show prediction if confident and consistent
+                    flags = FLAG_READY
+                    if conf > THRESHOLD and most_common == pred_idx:
+                        flags |= FLAG_CONFIDENT
+                        predicted_action = actions[pred_idx]
+                    else:
+                        predicted_action = "..."
+
+                    # Probabilities only when the top-1 changes or every PROBS_EVERY frames
+                    probs = b""
+                    if pred_idx != last_pred_idx or frame_count % PROBS_EVERY == 0:
+                        flags |= FLAG_PROBS
+                        probs = res.astype('<f4').tobytes()
+                    last_pred_idx = pred_idx
+
+                    response = RESPONSE_HDR.pack(flags, pred_idx, conf, frame_count) + probs
                     
+                    if frame_count % 50 == 0:
+                        print(f"Client {client_id[:8]}: {predicted_action} ({conf:.2f})")
+                
+                # Send response
+                await websocket.send_bytes(response)
+                
+            except WebSocketDisconnect:
+                print(f"✗ Client disconnected: {client_id}")
+                break
+            except Exception as e:
+                print(f"⚠ Error processing frame: {e}")
+                continue
+                
     except Exception as e:
         print(f"✗ WebSocket error for {client_id}: {e}")
     finally:
         # Cleanup
+        reader.cancel()
+        if worker_idx is not None:
+            worker_clients[worker_idx] -= 1
         clients_sequences.pop(client_id, None)
         clients_predictions.pop(client_id, None)
+        clients_counters.pop(client_id, None)
         print(f"✓ Cleaned up client: {client_id}")
 
 
@@ -195,7 +458,8 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "ok",
-        "model_loaded": model is not None,
+        "model_loaded": session is not None or interpreter is not None,
+        "model_file": model_file,
         "actions": actions,
         "active_clients": len(clients_sequences)
     }
@@ -221,7 +485,7 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     print("Starting Sinhala Sign Language Recognition Server")
     print("="*50)
-    print(f"Model: {MODEL_PATH}")
+    print(f"Model: {model_file}")
     print(f"Actions: {actions}")
     print(f"Sequence Length: {SEQUENCE_LENGTH}")
     print(f"Threshold: {THRESHOLD}")
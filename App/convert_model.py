@@ -0,0 +1,122 @@
+# convert_model.py
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+# ---------- Config ----------
+MODEL_PATH = "best_model.h5"
+FP16_PATH = "best_model.fp16.tflite"
+FP16_BATCH_PATH = "best_model.fp16.b16.tflite"
+BATCH_SIZE = 16                          # MUST match MAX_BATCH in app.py
+INT8_PATH = "best_model.int8.tflite"
+ONNX_PATH = "best_model.onnx"
+ONNX_OPSET = 15
+DATA_PATH = os.path.join("..", "VDO")   # used as the int8 representative dataset
+SEQUENCE_LENGTH = 40                     # MUST match your training SEQUENCE_LENGTH
+CALIBRATION_SAMPLES = 200
+BENCHMARK_RUNS = 200
+
+
+def _concrete_function(model, batch=1):
+    """Trace the model with a fixed batch size (TFLite's fused RNN ops need static shapes)"""
+    run_model = tf.function(lambda x: model(x))
+    return run_model.get_concrete_function(
+        tf.TensorSpec([batch] + list(model.inputs[0].shape[1:]), tf.float32)
+    )
+
+
+def convert_fp16(model, batch=1):
+    """Convert a Keras model to a float16-weight TFLite flatbuffer with a fixed batch size"""
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([_concrete_function(model, batch)], model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def representative_sequences(data_path=DATA_PATH, limit=CALIBRATION_SAMPLES):
+    """Yield recorded (1, SEQUENCE_LENGTH, D) sequences for int8 calibration"""
+    count = 0
+    for action in sorted(os.listdir(data_path)):
+        action_path = os.path.join(data_path, action)
+        if not os.path.isdir(action_path):
+            continue
+        for seq in sorted(d for d in os.listdir(action_path) if d.isdigit()):
+            seq_path = os.path.join(action_path, seq)
+            if os.path.exists(os.path.join(seq_path, "seq.npy")):
+                window = np.load(os.path.join(seq_path, "seq.npy"))
+            else:  # older captures: one .npy per frame
+                window = [np.load(os.path.join(seq_path, f"{i}.npy")) for i in range(SEQUENCE_LENGTH)
+                          if os.path.exists(os.path.join(seq_path, f"{i}.npy"))]
+            if len(window) != SEQUENCE_LENGTH:
+                continue
+            yield [np.expand_dims(np.array(window, dtype=np.float32), axis=0)]
+            count += 1
+            if count >= limit:
+                return
+
+
+def convert_int8(model, data_path=DATA_PATH):
+    """Convert a Keras model to an int8 TFLite flatbuffer calibrated on recorded data"""
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([_concrete_function(model)], model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: representative_sequences(data_path)
+    return converter.convert()
+
+
+def convert_onnx(model, output_path=ONNX_PATH):
+    """Export a Keras model to ONNX with a dynamic batch dimension (input name "input")"""
+    import tf2onnx
+
+    spec = [tf.TensorSpec([None] + list(model.inputs[0].shape[1:]), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=ONNX_OPSET, output_path=output_path)
+
+
+def benchmark(tflite_path, runs=BENCHMARK_RUNS):
+    """Return mean invoke() latency in milliseconds"""
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=os.cpu_count())
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    interpreter.set_tensor(inp['index'], np.random.rand(*inp['shape']).astype(np.float32))
+    interpreter.invoke()  # warm-up
+    start = time.perf_counter()
+    for _ in range(runs):
+        interpreter.invoke()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+# ---------- Main ----------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert best_model.h5 to TFLite (and optionally ONNX)")
+    parser.add_argument("--int8", action="store_true",
+                        help="also build an int8 model and keep it only if it benchmarks faster")
+    parser.add_argument("--onnx", action="store_true",
+                        help="also export best_model.onnx, which app.py then prefers over TFLite")
+    args = parser.parse_args()
+
+    model = load_model(MODEL_PATH)
+    with open(FP16_PATH, "wb") as f:
+        f.write(convert_fp16(model))
+    fp16_ms = benchmark(FP16_PATH)
+    print(f"✓ Saved {FP16_PATH} ({fp16_ms:.2f} ms/invoke)")
+    with open(FP16_BATCH_PATH, "wb") as f:
+        f.write(convert_fp16(model, batch=BATCH_SIZE))
+    print(f"✓ Saved {FP16_BATCH_PATH} (batch of {BATCH_SIZE}, {benchmark(FP16_BATCH_PATH):.2f} ms/invoke)")
+
+    if args.int8:
+        with open(INT8_PATH, "wb") as f:
+            f.write(convert_int8(model))
+        int8_ms = benchmark(INT8_PATH)
+        # int8 kernels are not always faster on x86, so only keep the model if it wins
+        if int8_ms < fp16_ms:
+            print(f"✓ Saved {INT8_PATH} ({int8_ms:.2f} ms/invoke) - set TFLITE_PATH in app.py to use it")
+        else:
+            os.remove(INT8_PATH)
+            print(f"⚠ int8 model slower ({int8_ms:.2f} ms/invoke), keeping float16")
+
+    if args.onnx:
+        convert_onnx(model)
+        print(f"✓ Saved {ONNX_PATH}")
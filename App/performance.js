@@ -429,11 +429,12 @@ class PerformanceManager {
 
     compressWebSocketData() {
         // Use compression for large data
+        const manager = this;
         const originalSend = WebSocket.prototype.send;
         WebSocket.prototype.send = function(data) {
             if (data instanceof ArrayBuffer && data.byteLength > 1024) {
-                // Compress large data
-                const compressed = this.compressData(data);
+                // Compress large data (`this` is the socket here, not the manager)
+                const compressed = manager.compressData(data);
                 originalSend.call(this, compressed);
             } else {
                 originalSend.call(this, data);
@@ -4,6 +4,19 @@ const THRESHOLD = 0.6;
 const REQUIRED_ATTEMPTS = 3;
 const STREAK_BONUS = 5; // Bonus points for consecutive correct signs
 
+// Keypoint layout - MUST match extract_keypoints in app.py
+const FACE_IDX = [0, 13, 14, 17, 61, 291];
+const KEYPOINT_LENGTH = 33 * 4 + FACE_IDX.length * 3 + 21 * 3 * 2;
+const KEYPOINTS_MSG = 1;     // version byte of keypoint messages
+const KEYPOINTS_HEADER = 4;  // version byte + padding so the floats stay aligned
+const HOLISTIC_CDN = 'https://cdn.jsdelivr.net/npm/@mediapipe/holistic@0.5.1675471629'; // MUST match the script tag in practice.html/exam.html
+
+// Binary prediction layout - MUST match RESPONSE_HDR in app.py
+const RESPONSE_HEADER = 12;  // flags, top-1 index, 2 pad bytes, float32 confidence, uint32 frame count
+const FLAG_READY = 0x01;
+const FLAG_CONFIDENT = 0x02;
+const FLAG_PROBS = 0x04;
+
 // Add this new mapping: English (from backend/model) to Sinhala (for UI comparison/display)
 const englishToSinhala = {
     'a_': 'අ',
@@ -21,6 +34,9 @@ const englishToSinhala = {
 
 // Global variables
 let video, canvas, ctx, ws;
+let actions = [];  // label order sent by the server on connect
+let holistic = null;
+let holisticBusy = false;
 let captureTimer = null;
 let currentLetterIndex = 0;
 let attempts = 0;
@@ -106,6 +122,7 @@ function initWebSocket() {
     console.log('Connecting to:', url);
     
     ws = new WebSocket(url);
+    ws.binaryType = 'arraybuffer';
     
     ws.onopen = () => {
         console.log('✓ WebSocket connected');
@@ -116,8 +133,11 @@ function initWebSocket() {
     
     ws.onmessage = (event) => {
         try {
-            const data = JSON.parse(event.data);
-            handlePrediction(data);
+            if (typeof event.data === 'string') {
+                actions = JSON.parse(event.data).actions;
+                return;
+            }
+            handlePrediction(decodePrediction(event.data));
         } catch (err) {
             console.error('Error parsing message:', err);
         }
@@ -136,11 +156,102 @@ function initWebSocket() {
     };
 }
 
+// Write one landmark group into the keypoint vector, zero-filled if missing
+function writeLandmarks(out, offset, landmarks, count, withVisibility) {
+    const stride = withVisibility ? 4 : 3;
+    if (!landmarks) {
+        out.fill(0, offset, offset + count * stride);
+        return offset + count * stride;
+    }
+    for (let i = 0; i < count; i++) {
+        const lm = landmarks[i];
+        out[offset++] = lm.x;
+        out[offset++] = lm.y;
+        out[offset++] = lm.z;
+        if (withVisibility) out[offset++] = lm.visibility || 0;
+    }
+    return offset;
+}
+
+// Send Holistic results as a keypoint message instead of a JPEG
+function sendKeypoints(results) {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+
+    const buffer = new ArrayBuffer(KEYPOINTS_HEADER + KEYPOINT_LENGTH * 4);
+    new Uint8Array(buffer)[0] = KEYPOINTS_MSG;
+    const kp = new Float32Array(buffer, KEYPOINTS_HEADER);
+
+    let offset = writeLandmarks(kp, 0, results.poseLandmarks, 33, true);
+    const face = results.faceLandmarks ? FACE_IDX.map(i => results.faceLandmarks[i]) : null;
+    offset = writeLandmarks(kp, offset, face, FACE_IDX.length, false);
+    offset = writeLandmarks(kp, offset, results.leftHandLandmarks, 21, false);
+    writeLandmarks(kp, offset, results.rightHandLandmarks, 21, false);
+
+    ws.send(buffer);
+}
+
+// Run MediaPipe Holistic in the browser when the library is available
+function initHolistic() {
+    if (holistic || typeof Holistic === 'undefined') return holistic;
+
+    holistic = new Holistic({
+        locateFile: file => `${HOLISTIC_CDN}/${file}`
+    });
+    // Same settings as the server-side Holistic in app.py
+    holistic.setOptions({
+        modelComplexity: 0,
+        refineFaceLandmarks: false,
+        enableSegmentation: false,
+        smoothLandmarks: false,
+        minDetectionConfidence: 0.5,
+        minTrackingConfidence: 0.5
+    });
+    holistic.onResults(sendKeypoints);
+    console.log('✓ Using in-browser Holistic');
+    return holistic;
+}
+
+// Decode a binary prediction frame from the backend
+function decodePrediction(buffer) {
+    const view = new DataView(buffer);
+    const flags = view.getUint8(0);
+    const data = { ready: (flags & FLAG_READY) !== 0 };
+    if (!data.ready) return data;
+
+    const predIdx = view.getUint8(1);
+    data.confidence = view.getFloat32(4, true);
+    data.frame_count = view.getUint32(8, true);
+    data.predicted_action = (flags & FLAG_CONFIDENT) ? actions[predIdx] : '...';
+    if (flags & FLAG_PROBS) {
+        data.probs = new Float32Array(buffer, RESPONSE_HEADER, actions.length);
+    }
+    return data;
+}
+
 // Start capturing frames
 function startCapturing() {
     if (!video || !ws || ws.readyState !== WebSocket.OPEN) return;
     if (captureTimer) return;
 
+    if (initHolistic()) {
+        const captureKeypoints = () => {
+            if (!ws || ws.readyState !== WebSocket.OPEN) {
+                stopCapturing();
+                return;
+            }
+            if (holisticBusy) return;  // previous frame still processing
+
+            holisticBusy = true;
+            holistic.send({ image: video })
+                .catch(err => console.error('Holistic error:', err))
+                .finally(() => { holisticBusy = false; });
+        };
+
+        captureTimer = setInterval(captureKeypoints, 100); // 10 FPS
+        return;
+    }
+
+    // Fallback: send JPEG frames and let the server run Holistic
     if (!canvas) {
         canvas = document.createElement('canvas');
         ctx = canvas.getContext('2d');
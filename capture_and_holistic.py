@@ -4,6 +4,8 @@ import time
 import numpy as np
 import mediapipe as mp
 
+from keypoints import KEYPOINT_LENGTH, extract_keypoints
+
 # ---------- CONFIG ----------
 BASE_DIR = "VDO"
 SEQUENCE_LENGTH = 40        # frames per sequence
@@ -15,8 +17,6 @@ NUM_VIDEOS = 50             # total videos per class
 mp_holistic = mp.solutions.holistic
 mp_drawing = mp.solutions.drawing_utils
 
-FACE_IDX = [0, 13, 14, 17, 61, 291]  # nose bridge, upper/lower lip centers, under lip, mouth corners
-
 def mediapipe_detection(image, model):
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     image.flags.writeable = False
@@ -24,28 +24,13 @@ def mediapipe_detection(image, model):
     image.flags.writeable = True
     return results
 
-def extract_keypoints(results):
-    pose = np.array([[res.x, res.y, res.z, res.visibility]
-                     for res in results.pose_landmarks.landmark]).flatten() if results.pose_landmarks else np.zeros(33*4)
-
-    if results.face_landmarks:
-        face = np.array([[results.face_landmarks.landmark[i].x,
-                          results.face_landmarks.landmark[i].y,
-                          results.face_landmarks.landmark[i].z] for i in FACE_IDX]).flatten()
-    else:
-        face = np.zeros(len(FACE_IDX) * 3)
-
-    lh = np.array([[res.x, res.y, res.z] for res in results.left_hand_landmarks.landmark]).flatten() if results.left_hand_landmarks else np.zeros(21*3)
-    rh = np.array([[res.x, res.y, res.z] for res in results.right_hand_landmarks.landmark]).flatten() if results.right_hand_landmarks else np.zeros(21*3)
-
-    return np.concatenate([pose, face, lh, rh])
-
 def smooth_sequence(seq):
-    seq = np.array(seq)
-    for i in range(1, len(seq)):
-        if not np.any(seq[i]):  # frame is all zeros
-            seq[i] = seq[i-1]   # copy last good frame
-    return seq
+    seq = np.asarray(seq)
+    # replace all-zero frames with the last good frame (forward fill, frame 0 kept as is)
+    good = seq.any(axis=1)
+    good[0] = True
+    idx = np.maximum.accumulate(np.where(good, np.arange(len(seq)), 0))
+    return seq[idx]
 
 # ---------- Ask for class name ----------
 class_name = input("Enter class name: ").strip()
@@ -58,6 +43,7 @@ cap = cv2.VideoCapture(0)
 if not cap.isOpened():
     print("Error: Cannot access webcam")
     exit()
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # keep only the newest frame queued (ignored by some backends)
 
 # Get video properties
 fps = cap.get(cv2.CAP_PROP_FPS)
@@ -77,10 +63,18 @@ with mp_holistic.Holistic(min_detection_confidence=0.7,
 
         print(f"\n[INFO] Video {vid_idx+1}/{NUM_VIDEOS}")
 
-        # rest countdown
-        for t in range(REST_DURATION, 0, -1):
-            print(f"Rest... {t}", end="\r")
-            time.sleep(1)
+        # rest countdown - keep reading so the webcam buffer doesn't fill with stale frames
+        rest_end = time.time() + REST_DURATION
+        while time.time() < rest_end:
+            if not cap.grab():
+                break
+            ret, frame = cap.retrieve()
+            if ret:
+                remaining = int(np.ceil(rest_end - time.time()))
+                cv2.putText(frame, f"Rest... {remaining}", (30, 60),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
+                cv2.imshow("Recording (Holistic)", frame)
+            cv2.waitKey(1)
 
         seq = []
         print("[INFO] Recording...")
@@ -118,19 +112,18 @@ with mp_holistic.Holistic(min_detection_confidence=0.7,
 
         writer.release()
 
-        # adjust to SEQUENCE_LENGTH
-        if len(seq) < SEQUENCE_LENGTH:
-            pad = [np.zeros_like(seq[0])] * (SEQUENCE_LENGTH - len(seq))
-            seq.extend(pad)
-        elif len(seq) > SEQUENCE_LENGTH:
+        # adjust to SEQUENCE_LENGTH (missing frames stay zero and get forward-filled below)
+        out = np.zeros((SEQUENCE_LENGTH, KEYPOINT_LENGTH), dtype=np.float32)
+        if len(seq) <= SEQUENCE_LENGTH:
+            out[:len(seq)] = seq
+        else:
             idxs = np.linspace(0, len(seq)-1, SEQUENCE_LENGTH).astype(int)
-            seq = [seq[i] for i in idxs]
+            out[:] = np.asarray(seq, dtype=np.float32)[idxs]
 
-        seq = smooth_sequence(seq)
+        seq = smooth_sequence(out)
 
-        # save npy sequence
-        for f_idx, frame_data in enumerate(seq):
-            np.save(os.path.join(vid_save_dir, f"{f_idx}.npy"), frame_data)
+        # save the whole sequence as one (SEQUENCE_LENGTH, KEYPOINT_LENGTH) array
+        np.save(os.path.join(vid_save_dir, "seq.npy"), seq)
 
         print(f"[SAVED] {class_name}/{vid_idx} ({len(seq)} frames)")
 
@@ -0,0 +1,52 @@
+# keypoints.py
+"""Keypoint layout and extraction shared by capture, live inference and the web app."""
+import numpy as np
+
+FACE_IDX = [0, 13, 14, 17, 61, 291]  # nose bridge, upper/lower lip centers, under lip, mouth corners
+
+POSE_SLICE = slice(0, 33*4)
+FACE_SLICE = slice(POSE_SLICE.stop, POSE_SLICE.stop + len(FACE_IDX)*3)
+LH_SLICE = slice(FACE_SLICE.stop, FACE_SLICE.stop + 21*3)
+RH_SLICE = slice(LH_SLICE.stop, LH_SLICE.stop + 21*3)
+KEYPOINT_LENGTH = RH_SLICE.stop
+BLOCKS = {"pose": POSE_SLICE, "face": FACE_SLICE, "left_hand": LH_SLICE, "right_hand": RH_SLICE}
+_KP = np.zeros(KEYPOINT_LENGTH, dtype=np.float32)  # default buffer for single-threaded scripts
+_KP_FILLED = [False] * 4                            # pose, face, lh, rh currently hold data
+
+
+def new_keypoint_buffer():
+    """Return an (out, filled) pair for callers that extract on several threads"""
+    return np.zeros(KEYPOINT_LENGTH, dtype=np.float32), [False] * 4
+
+
+def extract_keypoints(results, out=_KP, filled=_KP_FILLED):
+    """Extract keypoints from Mediapipe results into the preallocated buffer out
+
+    Each group is written straight into its slice of the buffer. filled[g] records whether
+    group g (pose, face, left hand, right hand) holds data, so a missing group is only
+    zeroed when the previous frame had written it. Returns a copy the caller may keep.
+    """
+    pose = results.pose_landmarks
+    if pose:
+        out[POSE_SLICE] = [c for res in pose.landmark
+                           for c in (res.x, res.y, res.z, res.visibility)]
+    elif filled[0]:
+        out[POSE_SLICE] = 0.0
+    filled[0] = bool(pose)
+
+    face = results.face_landmarks
+    if face:
+        lm = face.landmark
+        out[FACE_SLICE] = [c for i in FACE_IDX for c in (lm[i].x, lm[i].y, lm[i].z)]
+    elif filled[1]:
+        out[FACE_SLICE] = 0.0
+    filled[1] = bool(face)
+
+    for g, sl, hand in ((2, LH_SLICE, results.left_hand_landmarks), (3, RH_SLICE, results.right_hand_landmarks)):
+        if hand:
+            out[sl] = [c for res in hand.landmark for c in (res.x, res.y, res.z)]
+        elif filled[g]:
+            out[sl] = 0.0
+        filled[g] = bool(hand)
+
+    return out.copy()
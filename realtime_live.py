@@ -1,9 +1,11 @@
 import cv2
 import numpy as np
-from collections import deque
+from collections import Counter, deque
 import mediapipe as mp
 from tensorflow.keras.models import load_model
 
+from keypoints import extract_keypoints
+
 # ---------- Config ----------
 MODEL_PATH = "best_model.h5"
 ACTIONS_PATH = "actions.npy"
@@ -46,24 +48,6 @@ def draw_styled_landmarks(image, results):
             mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=4),
             mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2))
 
-FACE_IDX = [0, 13, 14, 17, 61, 291]  # nose bridge, upper/lower lip centers, under lip, mouth corners
-
-def extract_keypoints(results):
-    pose = np.array([[res.x, res.y, res.z, res.visibility]
-                     for res in results.pose_landmarks.landmark]).flatten() if results.pose_landmarks else np.zeros(33*4)
-
-    if results.face_landmarks:
-        face = np.array([[results.face_landmarks.landmark[i].x,
-                          results.face_landmarks.landmark[i].y,
-                          results.face_landmarks.landmark[i].z] for i in FACE_IDX]).flatten()
-    else:
-        face = np.zeros(len(FACE_IDX) * 3)
-
-    lh = np.array([[res.x, res.y, res.z] for res in results.left_hand_landmarks.landmark]).flatten() if results.left_hand_landmarks else np.zeros(21*3)
-    rh = np.array([[res.x, res.y, res.z] for res in results.right_hand_landmarks.landmark]).flatten() if results.right_hand_landmarks else np.zeros(21*3)
-
-    return np.concatenate([pose, face, lh, rh])
-
 def prob_viz(res, actions, input_frame):
     output_frame = input_frame.copy()
     for num, prob in enumerate(res):
@@ -80,6 +64,7 @@ print("Actions loaded:", actions)
 # ---------- realtime capture ----------
 sequence = deque(maxlen=SEQUENCE_LENGTH)
 predictions = deque(maxlen=SMOOTHING_WINDOW)
+prediction_counts = Counter()   # counts of the predictions currently in the window
 cap = cv2.VideoCapture(0)
 if not cap.isOpened():
     print("❌ Error: Could not open webcam. Try another index (0/1/2).")
@@ -87,7 +72,12 @@ if not cap.isOpened():
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 
-with mp_holistic.Holistic(min_detection_confidence=0.5, min_tracking_confidence=0.5) as holistic:
+with mp_holistic.Holistic(model_complexity=0,
+                          refine_face_landmarks=False,
+                          enable_segmentation=False,
+                          smooth_landmarks=False,
+                          min_detection_confidence=0.5,
+                          min_tracking_confidence=0.5) as holistic:
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
@@ -103,9 +93,12 @@ with mp_holistic.Holistic(min_detection_confidence=0.5, min_tracking_confidence=
             input_data = np.expand_dims(np.array(sequence, dtype=np.float32), axis=0)
             res = model.predict(input_data, verbose=0)[0]
             pred_idx = int(np.argmax(res))
+            if len(predictions) == predictions.maxlen:
+                prediction_counts[predictions[0]] -= 1  # about to be evicted
             predictions.append(pred_idx)
+            prediction_counts[pred_idx] += 1
 
-            most_common = max(set(predictions), key=predictions.count) if predictions else None
+            most_common = prediction_counts.most_common(1)[0][0]
             conf = float(res[pred_idx])
 
             if conf > THRESHOLD and most_common == pred_idx:
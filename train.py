@@ -1,13 +1,17 @@
 # train.py
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense
+from tensorflow.keras.layers import GRU, Bidirectional, Dense
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
-from tensorflow.keras.utils import to_categorical
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedShuffleSplit
 from collections import Counter
 
+from keypoints import BLOCKS, KEYPOINT_LENGTH as LAYOUT_LENGTH
+
 # ---------- Config ----------
 DATA_PATH = "VDO"
 SEQUENCE_LENGTH = 40
@@ -15,11 +19,22 @@ EPOCHS = 150
 BATCH_SIZE = 16
 TEST_SIZE = 0.15
 MODEL_OUT = "best_model.h5"
+CHECKPOINT_PATH = "best.weights.h5"   # weights-only, rewritten on every val_loss improvement
+CACHE_DIR = "cache"
+CACHE_DTYPE = np.float16   # rounding error on keypoints is <1e-3, far below the augmentation noise
 AUG_PER_SEQ = 25   # <-- number of augmentations per original sequence
-np.random.seed(42)
+NOISE_STD = 0.02   # gaussian noise std, per landmark block below when the layout matches
+NOISE_STD_BLOCKS = {"pose": 0.02, "face": 0.02, "left_hand": 0.02, "right_hand": 0.02}
+SEED = 42
 
 # ---------- discover actions ----------
-actions = sorted([d for d in os.listdir(DATA_PATH) if os.path.isdir(os.path.join(DATA_PATH, d))])
+def list_dirs(path, digits=False):
+    """Sorted sub-directory names of path (numeric order when digits), from a single scandir pass"""
+    with os.scandir(path) as it:
+        names = [e.name for e in it if e.is_dir() and (not digits or e.name.isdigit())]
+    return sorted(names, key=int) if digits else sorted(names)
+
+actions = list_dirs(DATA_PATH)
 print("Actions:", actions)
 ACTION_TO_INDEX = {a: i for i, a in enumerate(actions)}
 
@@ -27,14 +42,12 @@ ACTION_TO_INDEX = {a: i for i, a in enumerate(actions)}
 KEYPOINT_LENGTH = None
 for a in actions:
     a_path = os.path.join(DATA_PATH, a)
-    seqs = sorted([d for d in os.listdir(a_path) if os.path.isdir(os.path.join(a_path, d)) and d.isdigit()],
-                  key=lambda x: int(x))
-    for s in seqs:
+    for s in list_dirs(a_path, digits=True):
         seq_path = os.path.join(a_path, s)
         files = sorted([f for f in os.listdir(seq_path) if f.endswith('.npy')])
         if files:
             arr = np.load(os.path.join(seq_path, files[0]))
-            KEYPOINT_LENGTH = arr.shape[0]
+            KEYPOINT_LENGTH = arr.shape[-1]  # seq.npy is (frames, D), per-frame files are (D,)
             break
     if KEYPOINT_LENGTH:
         break
@@ -42,117 +55,218 @@ if KEYPOINT_LENGTH is None:
     raise FileNotFoundError("No .npy files found under DATA_PATH")
 print("KEYPOINT_LENGTH =", KEYPOINT_LENGTH)
 
+# per-channel noise std; blocks are contiguous slices of the keypoint vector (see keypoints.py)
+noise_std = np.full(KEYPOINT_LENGTH, NOISE_STD, dtype=np.float32)
+if KEYPOINT_LENGTH == LAYOUT_LENGTH:
+    for name, sl in BLOCKS.items():
+        noise_std[sl] = NOISE_STD_BLOCKS[name]
+else:
+    print(f"⚠ KEYPOINT_LENGTH != {LAYOUT_LENGTH}, using NOISE_STD for every channel")
+
 # ---------- augmentation functions ----------
-def add_noise(seq, noise_std=0.02):
-    return seq + np.random.normal(0, noise_std, seq.shape)
-
-def time_warp(seq, max_warp=0.2):
-    factor = np.random.uniform(1 - max_warp, 1 + max_warp)
-    old_idx = np.linspace(0, SEQUENCE_LENGTH - 1, num=SEQUENCE_LENGTH)
-    new_idx = np.linspace(0, SEQUENCE_LENGTH - 1, num=int(SEQUENCE_LENGTH * factor))
-    warped = np.zeros((SEQUENCE_LENGTH, KEYPOINT_LENGTH))
-    for k in range(KEYPOINT_LENGTH):
-        warped[:, k] = np.interp(old_idx,
-                                 new_idx[:SEQUENCE_LENGTH],
-                                 seq[:len(new_idx[:SEQUENCE_LENGTH]), k])
-    return warped
-
-def frame_dropout(seq, drop_prob=0.15):
-    mask = np.random.rand(SEQUENCE_LENGTH) > drop_prob
-    dropped = seq[mask]
-    if len(dropped) >= SEQUENCE_LENGTH:
-        return dropped[:SEQUENCE_LENGTH]
-    else:
-        pad = np.zeros((SEQUENCE_LENGTH - len(dropped), KEYPOINT_LENGTH))
-        return np.vstack([dropped, pad])
-
-def random_augment(seq):
-    # apply a random combo
-    seq_aug = seq.copy()
-    if np.random.rand() < 0.7:  # noise 70% chance
-        seq_aug = add_noise(seq_aug)
-    if np.random.rand() < 0.5:  # warp 50% chance
-        seq_aug = time_warp(seq_aug)
-    if np.random.rand() < 0.5:  # dropout 50% chance
-        seq_aug = frame_dropout(seq_aug)
-    return seq_aug
-
-# ---------- load + augment ----------
-sequences, labels = [], []
-
-for action in actions:
+# Graph-mode TF ops on whole (B, T, K) batches. Randomness comes from stateless ops seeded per
+# batch, so the same functions run inside tf.data's parallel map without touching the GIL.
+def add_noise_batch(X, mask, seed):
+    # gaussian noise with the per-channel std, only on the sequences selected by mask
+    noise = tf.random.stateless_normal(tf.shape(X), seed) * noise_std
+    return tf.where(mask[:, None, None], X + noise, X)
+
+def time_warp_batch(X, seed, max_warp=0.2):
+    # stretch/squeeze each sequence to int(T * factor) frames and read back the first T,
+    # linear interpolation between the two nearest source frames (clamped to the last one)
+    T = SEQUENCE_LENGTH
+    factor = tf.random.stateless_uniform(tf.shape(X)[:1], seed, 1 - max_warp, 1 + max_warp)
+    scale = (tf.floor(T * factor) - 1) / (T - 1)
+    src = tf.minimum(tf.range(T, dtype=tf.float32)[None, :] * scale[:, None], T - 1)   # (B, T)
+    i0 = tf.cast(src, tf.int32)
+    i1 = tf.minimum(i0 + 1, T - 1)
+    frac = (src - tf.cast(i0, tf.float32))[..., None]
+    x0 = tf.gather(X, i0, batch_dims=1)
+    x1 = tf.gather(X, i1, batch_dims=1)
+    return x0 + (x1 - x0) * frac
+
+def frame_dropout_batch(X, seed, drop_prob=0.15):
+    # drop random frames from each sequence, shift the kept ones forward and zero the tail
+    keep = tf.random.stateless_uniform(tf.shape(X)[:2], seed) > drop_prob
+    order = tf.argsort(tf.cast(~keep, tf.int32), axis=1, stable=True)   # kept frames first, in order
+    out = tf.gather(X, order, batch_dims=1)
+    n_keep = tf.reduce_sum(tf.cast(keep, tf.int32), axis=1, keepdims=True)
+    tail = tf.range(SEQUENCE_LENGTH)[None, :] >= n_keep
+    return tf.where(tail[..., None], tf.zeros_like(out), out)
+
+# ---------- load originals ----------
+def load_action(action):
+    """Read every recorded sequence of one action into a (num_sequences, T, K) array
+
+    Recordings must match the (SEQUENCE_LENGTH, KEYPOINT_LENGTH) layout, anything else raises
+    ValueError here so the cached arrays never need shape fixups. Missing frames stay zero.
+    """
     action_path = os.path.join(DATA_PATH, action)
-    seq_dirs = sorted([d for d in os.listdir(action_path) if d.isdigit()], key=lambda x: int(x))
-    for seq in seq_dirs:
-        # load original sequence
-        window = []
+    seq_dirs = list_dirs(action_path, digits=True)
+    out = np.zeros((len(seq_dirs), SEQUENCE_LENGTH, KEYPOINT_LENGTH), dtype=np.float32)
+    for i, seq in enumerate(seq_dirs):
+        # load original sequence (one seq.npy, or one .npy per frame for older captures)
+        seq_path = os.path.join(action_path, seq)
+        with os.scandir(seq_path) as it:
+            files = {e.name for e in it}
+        if "seq.npy" in files:
+            out[i] = _load_checked(os.path.join(seq_path, "seq.npy"), out.shape[1:])
+            continue
         for frame_num in range(SEQUENCE_LENGTH):
-            npy_path = os.path.join(action_path, seq, f"{frame_num}.npy")
-            if os.path.exists(npy_path):
-                arr = np.load(npy_path)
-                if arr.shape[0] != KEYPOINT_LENGTH:
-                    arr = (np.pad(arr, (0, KEYPOINT_LENGTH - arr.shape[0]))
-                           if arr.shape[0] < KEYPOINT_LENGTH else arr[:KEYPOINT_LENGTH])
-            else:
-                arr = np.zeros(KEYPOINT_LENGTH, dtype=np.float32)
-            window.append(arr)
-        window = np.array(window)
-
-        # original
-        sequences.append(window)
-        labels.append(ACTION_TO_INDEX[action])
-
-        # AUG_PER_SEQ augmentations
-        for _ in range(AUG_PER_SEQ):
-            aug_seq = random_augment(window)
-            sequences.append(aug_seq)
-            labels.append(ACTION_TO_INDEX[action])
-
-X = np.array(sequences, dtype=np.float32)
-y = to_categorical(labels).astype(int)
-
-print("Original sequences:", len(labels) // (AUG_PER_SEQ + 1))
-print("After augmentation:", len(labels))
-print("X shape:", X.shape)
-print("y shape:", y.shape)
-print("Class distribution:", Counter(labels))
+            if f"{frame_num}.npy" in files:
+                out[i, frame_num] = _load_checked(os.path.join(seq_path, f"{frame_num}.npy"), out.shape[2:])
+    return out
+
+def _load_checked(path, shape):
+    arr = np.load(path)
+    if arr.shape != shape:
+        raise ValueError(f"{path}: expected shape {shape}, got {arr.shape}")
+    return arr
+
+def action_fingerprint(action):
+    """md5 of an action's recordings (file names, sizes, mtimes) and the cached array shape"""
+    h = hashlib.md5(f"{SEQUENCE_LENGTH},{KEYPOINT_LENGTH},{np.dtype(CACHE_DTYPE)}".encode())
+    action_path = os.path.join(DATA_PATH, action)
+    for seq in list_dirs(action_path, digits=True):
+        with os.scandir(os.path.join(action_path, seq)) as it:
+            entries = sorted((e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in it)
+        h.update(repr((seq, entries)).encode())
+    return h.hexdigest()[:16]
+
+# The per-frame tree is slow to walk, so each action is stacked into
+# CACHE_DIR/<action>.<fingerprint>.npy once and memory-mapped afterwards. Re-recording an
+# action changes its fingerprint, so only that action is rebuilt and its old cache removed.
+# Actions are loaded in parallel threads, np.load spends most of its time in file I/O.
+os.makedirs(CACHE_DIR, exist_ok=True)
+cache_files = [os.path.join(CACHE_DIR, f"{action}.{action_fingerprint(action)}.npy") for action in actions]
+missing = [(a, f) for a, f in zip(actions, cache_files) if not os.path.exists(f)]
+with ThreadPoolExecutor() as pool:
+    for (action, cache_file), arr in zip(missing, pool.map(lambda m: load_action(m[0]), missing)):
+        with os.scandir(CACHE_DIR) as it:
+            stale = [e.path for e in it if e.name.startswith(f"{action}.") and e.path != cache_file]
+        for path in stale:
+            os.remove(path)
+        np.save(cache_file, arr.astype(CACHE_DTYPE))
+        print(f"Cached {action} -> {cache_file}")
+cached = [np.load(f, mmap_mode='r') for f in cache_files]
+
+X0 = np.concatenate(cached)
+y0 = np.repeat(np.arange(len(actions), dtype=np.int32), [len(c) for c in cached])
+N = len(X0)
+
+# ---------- augment ----------
+AUG_PROB = AUG_PER_SEQ / (AUG_PER_SEQ + 1)
+aug_rng = tf.random.Generator.from_seed(SEED)   # hands out a fresh stateless seed per batch
+
+# Only stateless ops, so the whole augmentation compiles into one XLA cluster: the noise, gathers
+# and selects are fused instead of each materialising a full (B, T, K) temporary.
+@tf.function(jit_compile=True, input_signature=[
+    tf.TensorSpec([None, SEQUENCE_LENGTH, None], tf.float32), tf.TensorSpec([2], tf.int64)])
+def augment_batch(X, seed):
+    # same mix as before: 1 in AUG_PER_SEQ+1 samples stays original, the rest get a random combo
+    seeds = tf.random.experimental.stateless_split(seed, num=4)
+    pick = tf.random.stateless_uniform([4, tf.shape(X)[0]], seeds[0])
+    aug = pick[0] < AUG_PROB
+    X = add_noise_batch(X, aug & (pick[1] < 0.7), seeds[1])                       # noise 70% chance
+    warp = aug & (pick[2] < 0.5)                                                  # warp 50% chance
+    X = tf.where(warp[:, None, None], time_warp_batch(X, seeds[2]), X)
+    drop = aug & (pick[3] < 0.5)                                                  # dropout 50% chance
+    X = tf.where(drop[:, None, None], frame_dropout_batch(X, seeds[3]), X)
+    return X
+
+def augment_tf(X, y):
+    return augment_batch(X, aug_rng.make_seeds(1)[:, 0]), y
+
+print("Original sequences:", N)
+print("Class distribution:", Counter(y0.tolist()))
 
 # ---------- train/test split ----------
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=TEST_SIZE, random_state=42, stratify=labels
-)
-print("Train:", X_train.shape, "Test:", X_test.shape)
+# split the originals by index, so no augmented copy of a test sequence ends up in training
+# and neither split is copied out of X0 (same split as train_test_split with stratify)
+splitter = StratifiedShuffleSplit(n_splits=1, test_size=TEST_SIZE, random_state=42)
+train_idx, test_idx = next(splitter.split(np.zeros(N), y0))
+print("Train:", len(train_idx), "Test:", len(test_idx))
+print("Train samples per epoch:", len(train_idx) * (1 + AUG_PER_SEQ))
+
+X0_t, y0_t = tf.constant(X0), tf.constant(y0)
+del X0, cached
+
+def gather(idx):
+    # originals stay in CACHE_DTYPE in memory, only the gathered batch is widened to float32
+    return tf.cast(tf.gather(X0_t, idx), tf.float32), tf.gather(y0_t, idx)
+
+# Only the originals are kept in memory; each epoch streams AUG_PER_SEQ+1 passes over
+# them and augments batch by batch (fresh augmentations every epoch), overlapping with
+# training via prefetch. Batches may come back out of order so a slow one doesn't stall.
+# Only sequence ids are shuffled (a few KB buffer), in a fresh order for every pass. Each
+# pass is batched on its own before repeating, so no batch spans two passes and a batch never
+# holds several copies of the same sequence. The leftover ids of a pass are dropped rather
+# than sent as a tiny batch; the reshuffle makes that a different few ids every pass.
+train_ds = (tf.data.Dataset.from_tensor_slices(train_idx.astype(np.int32))
+            .shuffle(len(train_idx), reshuffle_each_iteration=True)
+            .batch(BATCH_SIZE, drop_remainder=True)
+            .repeat(AUG_PER_SEQ + 1)
+            .map(gather)
+            .map(augment_tf, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+            .prefetch(tf.data.AUTOTUNE))
+test_ds = (tf.data.Dataset.from_tensor_slices(test_idx.astype(np.int32))
+           .batch(BATCH_SIZE)
+           .map(gather)
+           .cache()
+           .prefetch(tf.data.AUTOTUNE))
 
 # ---------- model ----------
-model = Sequential()
-model.add(LSTM(128, return_sequences=True, activation='relu', input_shape=(SEQUENCE_LENGTH, KEYPOINT_LENGTH)))
-model.add(LSTM(64, return_sequences=False, activation='relu'))
-model.add(Dense(64, activation='relu'))
-model.add(Dense(len(actions), activation='softmax'))
+GPU = bool(tf.config.list_physical_devices('GPU'))
+# float16 compute only pays off on GPU tensor cores, on CPU it is slower than float32
+MIXED_PRECISION = GPU
+if MIXED_PRECISION:
+    tf.keras.mixed_precision.set_global_policy('mixed_float16')
+
+def build_model():
+    model = Sequential()
+    # one bidirectional GRU (3 gates instead of 4) in place of the LSTM(128) -> LSTM(64) stack;
+    # default tanh/sigmoid activations so Keras can use the fused cuDNN/oneDNN kernel
+    model.add(Bidirectional(GRU(96, return_sequences=False), input_shape=(SEQUENCE_LENGTH, KEYPOINT_LENGTH)))
+    model.add(Dense(64, activation='relu'))
+    model.add(Dense(len(actions), activation='softmax', dtype='float32'))  # softmax + loss in float32
+    return model
+
+model = build_model()
 
-model.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['categorical_accuracy'])
+model.compile(optimizer='Adam', loss='sparse_categorical_crossentropy', metrics=['sparse_categorical_accuracy'])
 model.summary()
 
 # ---------- callbacks ----------
 callbacks = [
-    ModelCheckpoint(MODEL_OUT, monitor='val_loss', save_best_only=True, verbose=1, mode='min'),
-    EarlyStopping(monitor='val_loss', patience=30, restore_best_weights=True, verbose=1),
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=7, verbose=1)
+    # weights only: much cheaper than serializing the full model on each improvement,
+    # MODEL_OUT is written once at the end from the best weights
+    ModelCheckpoint(CHECKPOINT_PATH, monitor='val_loss', save_best_only=True, save_weights_only=True,
+                    verbose=1, mode='min'),
+    # each epoch is AUG_PER_SEQ+1 passes over the data, so plateaus show up within a few epochs
+    EarlyStopping(monitor='val_loss', patience=15, verbose=1),
+    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, verbose=1)
 ]
 
 # ---------- train ----------
 history = model.fit(
-    X_train, y_train,
-    validation_data=(X_test, y_test),
+    train_ds,
+    validation_data=test_ds,
     epochs=EPOCHS,
-    batch_size=BATCH_SIZE,
     callbacks=callbacks
 )
 
 # ---------- final evaluation ----------
-loss, acc = model.evaluate(X_test, y_test, verbose=0)
+model.load_weights(CHECKPOINT_PATH)
+loss, acc = model.evaluate(test_ds, verbose=0)
 print(f"Final test loss: {loss:.4f}  test acc: {acc:.4f}")
 
 # ---------- save ----------
+export = model
+if MIXED_PRECISION:
+    # re-save with float32 layers so TFLite/ONNX conversion and CPU inference stay float32
+    tf.keras.mixed_precision.set_global_policy('float32')
+    export = build_model()
+    export.set_weights(model.get_weights())
+export.save(MODEL_OUT)
 np.save("actions.npy", np.array(actions))
 print(f"Model + actions saved: {MODEL_OUT}, actions.npy")